@@ -2,41 +2,241 @@
 FastAPI backend for RAG AI Decision Assistant
 Provides REST API endpoints for question-answering with session management
 """
-import json
+import asyncio
+import functools
+import hashlib
 import logging
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, status
+import msgspec
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel, Field
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
 
-from retriever import get_answer
+from retriever import get_answer, get_answer_stream, get_answers_batch_async, get_qa_chain, load_vector_store
 from config import settings
+from redis_store import close_redis_client, create_redis_client
 
-# Redis import with fallback
-try:
-    import redis
-    REDIS_AVAILABLE = True
-except ImportError:
-    REDIS_AVAILABLE = False
-    logging.warning("Redis not available. Install with: pip install redis")
+# Settings read on the request path, resolved once at import
+LOG_LEVEL = getattr(logging, settings.log_level)
+RATE_LIMIT_PER_MINUTE = settings.rate_limit_per_minute
+API_HOST = settings.api_host
+API_PORT = settings.api_port
 
 # Configure logging
 logging.basicConfig(
-    level=getattr(logging, settings.log_level),
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+class Message(msgspec.Struct):
+    """Single question/answer exchange stored in a session"""
+    question: str
+    answer: str
+    timestamp: str
+
+
+class Session(msgspec.Struct):
+    """Conversation history stored per session"""
+    created_at: str
+    updated_at: str = ""
+    messages: List[Message] = msgspec.field(default_factory=list)
+
+
+session_encoder = msgspec.json.Encoder()
+session_decoder = msgspec.json.Decoder(Session)
+
+# Redis client (with fallback to in-memory)
+SESSION_TTL = 86400  # 24 hours in seconds
+FALLBACK_MAX_SESSIONS = 10_000
+# Fallback if Redis unavailable; bounded and expiring like the Redis keys
+_fallback_sessions: TTLCache = TTLCache(maxsize=FALLBACK_MAX_SESSIONS, ttl=SESSION_TTL)
+_fallback_lock = asyncio.Lock()
+STATS_TTL = 86400  # Per-session question counters, 24 hours
+ANSWER_TTL = 3600  # Cached answers, 1 hour
+
+# Redis key prefixes (kept short since they travel with every command)
+SESSION_KEY_PREFIX = "s:"
+ANSWER_KEY_PREFIX = "a:"
+RATE_LIMIT_KEY_PREFIX = "rl:"
+RATE_LIMIT_WINDOW = 60  # Seconds per rate limit bucket
+
+# Short-lived in-process answer cache so bursts of identical questions
+# are served without touching Redis or the LLM
+_answer_cache: TTLCache = TTLCache(maxsize=1024, ttl=1.0)
+
+# Questions currently being answered (question hash -> task computing the answer)
+_inflight: Dict[str, asyncio.Task] = {}
+_inflight_lock = asyncio.Lock()
+
+# Last successful /health result, so frequent probes don't hit Redis every time
+HEALTH_CACHE_TTL = 5.0
+_health_cache: TTLCache = TTLCache(maxsize=1, ttl=HEALTH_CACHE_TTL)
+LLM_MAX_WORKERS = 32  # Threads for retrieval/streaming, and concurrent LLM calls for batched answers
+CLOCK_INTERVAL = 0.5  # Seconds between refreshes of the cached timestamp
+BATCH_MAX_SIZE = 16  # Questions answered together in one micro-batch
+BATCH_MAX_WAIT = 0.03  # Seconds to wait for a micro-batch to fill up
+
+# Current UTC time as ISO string, refreshed by a background task so
+# request handlers don't format a new datetime for every field
+_now_iso = datetime.utcnow().isoformat()
+
+
+async def _tick_clock() -> None:
+    """Refresh the cached timestamp in the background"""
+    global _now_iso
+    while True:
+        _now_iso = datetime.utcnow().isoformat()
+        await asyncio.sleep(CLOCK_INTERVAL)
+
+
+class BatchQueue:
+    """
+    Collects questions for a few milliseconds and answers them as one batch
+    
+    Batching lets the retriever embed and search all queued questions with
+    a single call instead of one call per request.
+    """
+    
+    def __init__(self, executor: ThreadPoolExecutor, max_size: int = BATCH_MAX_SIZE, max_wait: float = BATCH_MAX_WAIT):
+        self.executor = executor
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._worker: Optional[asyncio.Task] = None
+        self._batches: set = set()
+        # Batched LLM calls run on the event loop, outside the thread pool,
+        # so they need their own bound to avoid provider rate limits
+        self._llm_limit = asyncio.Semaphore(LLM_MAX_WORKERS)
+    
+    def start(self) -> None:
+        """Start collecting batches in the background"""
+        self._worker = asyncio.create_task(self._collect())
+    
+    async def stop(self) -> None:
+        """Stop the collector and fail questions still waiting in the queue"""
+        if self._worker is not None:
+            self._worker.cancel()
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+    
+    async def submit(self, question: str) -> Dict:
+        """
+        Queue a question and wait for its answer
+        
+        Args:
+            question: User's question
+            
+        Returns:
+            Dictionary with 'answer', 'sources', and 'confidence' fields
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, future))
+        return await future
+    
+    async def _collect(self) -> None:
+        """Group queued questions into batches and dispatch them"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # Answer in the background so the next batch can start filling
+            task = asyncio.create_task(self._answer(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+    
+    async def _answer(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        """Answer one batch (retrieval on the thread pool) and resolve its futures"""
+        questions = [question for question, _ in batch]
+        try:
+            results = await get_answers_batch_async(questions, self.executor, self._llm_limit)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+async def ensure_knowledge_base() -> None:
+    """
+    Load the vector store on the LLM thread pool unless already loaded
+    
+    Raises:
+        FileNotFoundError: If the index has not been created yet
+    """
+    if getattr(app.state, "knowledge_base_ready", False):
+        return
+    app.state.vector_store = await asyncio.get_running_loop().run_in_executor(
+        getattr(app.state, "llm_pool", None),
+        load_vector_store
+    )
+    app.state.knowledge_base_ready = True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown"""
+    clock_task = asyncio.create_task(_tick_clock())
+    app.state.redis = await create_redis_client()
+    app.state.llm_pool = ThreadPoolExecutor(
+        max_workers=LLM_MAX_WORKERS,
+        thread_name_prefix="llm"
+    )
+    app.state.batch_queue = BatchQueue(app.state.llm_pool)
+    app.state.batch_queue.start()
+    
+    # Load the knowledge base and build the QA chain before serving so the
+    # first request doesn't pay for it; the vector codes and chunk texts are
+    # memory-mapped, so workers share their page-cache copy (HNSW graph links
+    # and the embedding model are still loaded per worker)
+    app.state.knowledge_base_ready = False
+    try:
+        await ensure_knowledge_base()
+        await asyncio.get_running_loop().run_in_executor(app.state.llm_pool, get_qa_chain)
+    except FileNotFoundError:
+        logger.warning("Vector store not found. Run ingest.py to create the index.")
+    except Exception as e:
+        logger.error("Error during startup warm-up: %s", e)
+    
+    yield
+    clock_task.cancel()
+    await app.state.batch_queue.stop()
+    app.state.llm_pool.shutdown(wait=False, cancel_futures=True)
+    await close_redis_client(app.state.redis)
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="RAG AI Decision Assistant API",
     description="AI decision assistant for volleyball athletes using RAG",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Mount static files and templates
@@ -45,102 +245,165 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # In production, specify allowed origins
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["content-type"],
+    max_age=settings.cors_max_age,
 )
 
-# Redis client (with fallback to in-memory)
-_redis_client = None
-_fallback_sessions: Dict[str, Dict] = {}  # Fallback if Redis unavailable
-SESSION_TTL = 86400  # 24 hours in seconds
-
 
 def get_redis_client():
-    """Get or create Redis client"""
-    global _redis_client
-    
-    if not REDIS_AVAILABLE:
-        return None
-    
-    if _redis_client is not None:
-        return _redis_client
-    
-    try:
-        _redis_client = redis.Redis(
-            host=settings.redis_host,
-            port=settings.redis_port,
-            db=settings.redis_db,
-            password=settings.redis_password if settings.redis_password else None,
-            ssl=settings.redis_ssl,
-            decode_responses=settings.redis_decode_responses,
-            socket_connect_timeout=5,
-            socket_timeout=5,
-            retry_on_timeout=True
-        )
-        # Test connection
-        _redis_client.ping()
-        logger.info(f"Connected to Redis at {settings.redis_host}:{settings.redis_port}")
-        return _redis_client
-    except Exception as e:
-        logger.warning(f"Redis connection failed: {str(e)}. Using in-memory storage.")
-        _redis_client = None
-        return None
+    """Get the shared Redis client, or None when using in-memory storage"""
+    return getattr(app.state, "redis", None)
 
 
-def get_session(session_id: str) -> Optional[Dict]:
+async def get_session(session_id: str) -> Optional[Session]:
     """Get session from Redis or fallback storage"""
     redis_client = get_redis_client()
     
     if redis_client:
         try:
-            data = redis_client.get(f"session:{session_id}")
+            data = await redis_client.get(f"{SESSION_KEY_PREFIX}{session_id}")
             if data:
-                return json.loads(data)
+                return session_decoder.decode(data)
+            return None
         except Exception as e:
-            logger.error(f"Error reading from Redis: {str(e)}")
+            logger.error("Error reading from Redis: %s", e)
             # Fallback to in-memory
-            return _fallback_sessions.get(session_id)
-    else:
+    
+    async with _fallback_lock:
         return _fallback_sessions.get(session_id)
 
 
-def save_session(session_id: str, session_data: Dict) -> None:
+async def save_session(session_id: str, session_data: Session) -> None:
     """Save session to Redis or fallback storage"""
     redis_client = get_redis_client()
     
     if redis_client:
         try:
-            redis_client.setex(
-                f"session:{session_id}",
+            await redis_client.setex(
+                f"{SESSION_KEY_PREFIX}{session_id}",
                 SESSION_TTL,
-                json.dumps(session_data)
+                session_encoder.encode(session_data)
             )
+            return
         except Exception as e:
-            logger.error(f"Error writing to Redis: {str(e)}")
+            logger.error("Error writing to Redis: %s", e)
             # Fallback to in-memory
-            _fallback_sessions[session_id] = session_data
+    
+    async with _fallback_lock:
+        _fallback_sessions[session_id] = session_data
+
+
+def question_hash(question: str) -> str:
+    """Stable short hash of a question, used as the answer cache key"""
+    return hashlib.blake2b(question.strip().encode(), digest_size=16).hexdigest()
+
+
+async def fetch_request_state(
+    session_id: Optional[str],
+    qhash: str,
+    client_key: str
+) -> Tuple[Optional[Session], Optional[Dict], int]:
+    """
+    Fetch session and cached answer and count the question against the
+    client's rate limit, all in a single Redis round-trip
+    
+    Args:
+        session_id: Optional existing session ID
+        qhash: Question hash from question_hash()
+        client_key: Identifier the rate limit is applied to
+        
+    Returns:
+        Tuple of session data, cached answer (either may be None) and the
+        number of questions the client asked this minute (0 if not tracked)
+    """
+    cached_answer = _answer_cache.get(qhash)
+    redis_client = get_redis_client()
+    
+    if redis_client:
+        try:
+            rate_key = f"{RATE_LIMIT_KEY_PREFIX}{client_key}:{int(time.time() // RATE_LIMIT_WINDOW)}"
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.incr(rate_key)
+                pipe.expire(rate_key, RATE_LIMIT_WINDOW + 10)
+                pipe.get(f"{ANSWER_KEY_PREFIX}{qhash}")
+                if session_id:
+                    pipe.get(f"{SESSION_KEY_PREFIX}{session_id}")
+                values = await pipe.execute()
+            question_count, _, answer_raw = values[:3]
+            session_raw = values[3] if session_id else None
+            if cached_answer is None and answer_raw:
+                cached_answer = orjson.loads(answer_raw)
+                _answer_cache[qhash] = cached_answer
+            session_data = session_decoder.decode(session_raw) if session_raw else None
+            return session_data, cached_answer, question_count
+        except Exception as e:
+            logger.error("Error reading from Redis: %s", e)
+            # Fallback to in-memory
+    
+    if not session_id:
+        return None, cached_answer, 0
+    async with _fallback_lock:
+        return _fallback_sessions.get(session_id), cached_answer, 0
+
+
+async def save_exchange(
+    session_id: str,
+    session_data: Session,
+    qhash: str,
+    result: Optional[Dict] = None
+) -> None:
+    """
+    Save session, bump its question counter and cache a fresh answer
+    in a single Redis round-trip
+    
+    Args:
+        session_id: Session identifier
+        session_data: Session payload to store
+        qhash: Question hash from question_hash()
+        result: Newly generated answer to cache, if any
+    """
+    # Error answers carry no sources; never cache those
+    if result is not None and result.get("sources"):
+        _answer_cache[qhash] = result
     else:
+        result = None
+    
+    redis_client = get_redis_client()
+    
+    if redis_client:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                pipe.setex(f"{SESSION_KEY_PREFIX}{session_id}", SESSION_TTL, session_encoder.encode(session_data))
+                pipe.hincrby("stats:questions", session_id, 1)
+                pipe.expire("stats:questions", STATS_TTL)
+                if result is not None:
+                    pipe.setex(f"{ANSWER_KEY_PREFIX}{qhash}", ANSWER_TTL, orjson.dumps(result))
+                await pipe.execute()
+            return
+        except Exception as e:
+            logger.error("Error writing to Redis: %s", e)
+            # Fallback to in-memory
+    
+    async with _fallback_lock:
         _fallback_sessions[session_id] = session_data
 
 
-def delete_session(session_id: str) -> bool:
+async def delete_session(session_id: str) -> bool:
     """Delete session from Redis or fallback storage"""
     redis_client = get_redis_client()
     
     if redis_client:
         try:
-            deleted = redis_client.delete(f"session:{session_id}")
+            deleted = await redis_client.delete(f"{SESSION_KEY_PREFIX}{session_id}")
             return deleted > 0
         except Exception as e:
-            logger.error(f"Error deleting from Redis: {str(e)}")
+            logger.error("Error deleting from Redis: %s", e)
             # Fallback to in-memory
-            if session_id in _fallback_sessions:
-                del _fallback_sessions[session_id]
-                return True
-            return False
-    else:
+    
+    async with _fallback_lock:
         if session_id in _fallback_sessions:
             del _fallback_sessions[session_id]
             return True
@@ -149,6 +412,8 @@ def delete_session(session_id: str) -> bool:
 
 class QueryRequest(BaseModel):
     """Request model for asking questions"""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+    
     user_id: Optional[str] = Field(None, description="User identifier")
     question: str = Field(..., min_length=1, max_length=1000, description="User's question")
     session_id: Optional[str] = Field(None, description="Session identifier for conversation tracking")
@@ -156,6 +421,8 @@ class QueryRequest(BaseModel):
 
 class QueryResponse(BaseModel):
     """Response model for answers"""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+    
     answer: str
     session_id: str
     sources: list
@@ -165,33 +432,163 @@ class QueryResponse(BaseModel):
 
 class HealthResponse(BaseModel):
     """Health check response"""
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+    
     status: str
     message: str
     timestamp: str
 
 
-def get_or_create_session(session_id: Optional[str] = None) -> str:
+async def _compute_answer(qhash: str, question: str, user_id: Optional[str]) -> Dict:
     """
-    Get existing session or create a new one
+    Answer a question on behalf of every request waiting for it
+    
+    Runs as its own task, so it finishes even if the request that started
+    it is cancelled.
     
     Args:
-        session_id: Optional existing session ID
+        qhash: Question hash from question_hash()
+        question: User's question
+        user_id: Optional user ID for logging/tracking
         
     Returns:
-        Session ID string
+        Dictionary with 'answer', 'sources', and 'confidence' fields
     """
-    if session_id:
-        existing_session = get_session(session_id)
-        if existing_session:
-            return session_id
-    
-    new_session_id = str(uuid.uuid4())
-    session_data = {
-        "created_at": datetime.utcnow().isoformat(),
-        "messages": []
-    }
-    save_session(new_session_id, session_data)
-    return new_session_id
+    try:
+        batch_queue: Optional[BatchQueue] = getattr(app.state, "batch_queue", None)
+        if batch_queue is not None:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Queueing question from user %s: %s...", user_id, question[:100])
+            return await batch_queue.submit(question)
+        return await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(get_answer, question, user_id=user_id)
+        )
+    finally:
+        async with _inflight_lock:
+            _inflight.pop(qhash, None)
+
+
+def _log_unretrieved_error(task: asyncio.Task) -> None:
+    """Log the failure of an answer task whose waiters were all cancelled"""
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug("Shared answer task failed: %s", task.exception())
+
+
+async def answer_once(qhash: str, question: str, user_id: Optional[str] = None) -> Dict:
+    """
+    Get an answer from the RAG system, sharing a single call between
+    concurrent requests for the same question
+    
+    Args:
+        qhash: Question hash from question_hash()
+        question: User's question
+        user_id: Optional user ID for logging/tracking
+        
+    Returns:
+        Dictionary with 'answer', 'sources', and 'confidence' fields
+    """
+    async with _inflight_lock:
+        task = _inflight.get(qhash)
+        if task is None:
+            task = asyncio.create_task(_compute_answer(qhash, question, user_id))
+            task.add_done_callback(_log_unretrieved_error)
+            _inflight[qhash] = task
+    
+    # Shield so a cancelled caller, including the one that started the task,
+    # does not cancel the answer the other callers are waiting for
+    return await asyncio.shield(task)
+
+
+async def iterate_in_pool(iterator: Iterator) -> AsyncIterator:
+    """
+    Consume a blocking iterator on the LLM thread pool
+    
+    Args:
+        iterator: Synchronous iterator, e.g. a streaming LLM generator
+        
+    Yields:
+        Items produced by the iterator
+    """
+    loop = asyncio.get_running_loop()
+    pool = getattr(app.state, "llm_pool", None)
+    exhausted = object()
+    while True:
+        item = await loop.run_in_executor(pool, next, iterator, exhausted)
+        if item is exhausted:
+            return
+        yield item
+
+
+def create_session() -> Tuple[str, Session]:
+    """
+    Create a new session
+    
+    New sessions are not persisted here; the caller saves them together
+    with the first answer so each question costs one read and one write.
+    
+    Returns:
+        Tuple of session ID and session data
+    """
+    new_session_id = uuid.uuid4().hex
+    return new_session_id, Session(created_at=_now_iso)
+
+
+async def prepare_question(
+    query: QueryRequest,
+    request: Request
+) -> Tuple[str, str, Session, Optional[Dict]]:
+    """
+    Resolve session, cached answer and rate limit for an incoming question
+    
+    Args:
+        query: Query request with question and optional session info
+        request: Incoming HTTP request, used to identify anonymous clients
+        
+    Returns:
+        Tuple of question hash, session ID, session data and cached answer
+        
+    Raises:
+        HTTPException: 429 if the client exceeded its rate limit
+    """
+    qhash = question_hash(query.question)
+    client_key = query.user_id or query.session_id or (request.client.host if request.client else "anonymous")
+    session_data, cached_result, question_count = await fetch_request_state(
+        query.session_id,
+        qhash,
+        client_key
+    )
+    
+    if RATE_LIMIT_PER_MINUTE and question_count > RATE_LIMIT_PER_MINUTE:
+        logger.warning("Rate limit exceeded for %s", client_key)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many questions. Please wait a minute and try again."
+        )
+    
+    if session_data:
+        session_id = query.session_id
+    else:
+        session_id, session_data = create_session()
+    return qhash, session_id, session_data, cached_result
+
+
+def add_message(session_data: Session, question: str, answer: str) -> str:
+    """
+    Append a question/answer pair to the session history
+    
+    Args:
+        session_data: Session payload to update in place
+        question: User's question
+        answer: Generated answer
+        
+    Returns:
+        Timestamp recorded for the message
+    """
+    now = _now_iso
+    session_data.messages.append(Message(question=question, answer=answer, timestamp=now))
+    session_data.updated_at = now
+    return now
 
 
 @app.get("/")
@@ -205,35 +602,40 @@ async def health_check_api():
     return {
         "status": "healthy",
         "message": "RAG AI Decision Assistant API is running ✅",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": _now_iso
     }
 
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Detailed health check endpoint"""
+    cached = _health_cache.get("health")
+    if cached is not None:
+        return cached
+    
     try:
-        # Try to load the vector store to verify system is ready
-        from retriever import load_vector_store
-        load_vector_store()
+        # Verify the knowledge base is loaded (loads it if ingestion ran after startup)
+        await ensure_knowledge_base()
         
         # Check Redis connection
         redis_status = "not configured (using in-memory)"
         redis_client = get_redis_client()
         if redis_client:
             try:
-                redis_client.ping()
+                await redis_client.ping()
                 redis_status = "connected"
             except Exception as e:
                 redis_status = f"disconnected: {str(e)} (using fallback)"
         
-        return {
+        health = {
             "status": "healthy",
             "message": f"System is operational. Knowledge base loaded. Redis: {redis_status}",
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": _now_iso
         }
+        _health_cache["health"] = health
+        return health
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+        logger.error("Health check failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail=f"System not ready: {str(e)}"
@@ -241,12 +643,13 @@ async def health_check():
 
 
 @app.post("/ask", response_model=QueryResponse)
-async def ask(query: QueryRequest):
+async def ask(query: QueryRequest, request: Request):
     """
     Main endpoint for asking questions
     
     Args:
         query: Query request with question and optional session info
+        request: Incoming HTTP request
         
     Returns:
         QueryResponse with answer, sources, and metadata
@@ -255,32 +658,26 @@ async def ask(query: QueryRequest):
         HTTPException: If processing fails
     """
     try:
-        # Validate question
-        if not query.question or not query.question.strip():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Question cannot be empty"
-            )
-        
-        # Get or create session
-        session_id = get_or_create_session(query.session_id)
+        # Get or create session, look up a cached answer and apply the rate
+        # limit in the same round-trip
+        qhash, session_id, session_data, cached_result = await prepare_question(query, request)
         
         # Get answer from RAG system
-        logger.info(f"Processing question for session {session_id}")
-        result = get_answer(query.question, user_id=query.user_id or session_id)
+        if cached_result is not None:
+            logger.info("Serving cached answer for session %s", session_id)
+            result = cached_result
+        else:
+            logger.info("Processing question for session %s", session_id)
+            result = await answer_once(qhash, query.question, user_id=query.user_id or session_id)
         
         # Update session history
-        session_data = get_session(session_id) or {
-            "created_at": datetime.utcnow().isoformat(),
-            "messages": []
-        }
-        session_data["messages"].append({
-            "question": query.question,
-            "answer": result["answer"],
-            "timestamp": datetime.utcnow().isoformat()
-        })
-        session_data["updated_at"] = datetime.utcnow().isoformat()
-        save_session(session_id, session_data)
+        now = add_message(session_data, query.question, result["answer"])
+        await save_exchange(
+            session_id,
+            session_data,
+            qhash,
+            result if cached_result is None else None
+        )
         
         # Return structured response
         return QueryResponse(
@@ -288,23 +685,86 @@ async def ask(query: QueryRequest):
             session_id=session_id,
             sources=result.get("sources", []),
             confidence=result.get("confidence", 0.0),
-            timestamp=datetime.utcnow().isoformat()
+            timestamp=now
         )
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing question: {str(e)}")
+        logger.error("Error processing question: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error processing question: {str(e)}"
         )
 
 
+@app.post("/ask/stream")
+async def ask_stream(query: QueryRequest, request: Request):
+    """
+    Streaming variant of /ask using server-sent events
+    
+    Emits `data: {"token": ...}` events as the answer is generated and a
+    final `data: {"done": true, "sources": [...], "confidence": ...,
+    "session_id": ...}` event once it is complete.
+    
+    Args:
+        query: Query request with question and optional session info
+        request: Incoming HTTP request
+        
+    Returns:
+        StreamingResponse with `text/event-stream` content
+        
+    Raises:
+        HTTPException: 429 if the client exceeded its rate limit
+    """
+    qhash, session_id, session_data, cached_result = await prepare_question(query, request)
+    
+    async def event_stream() -> AsyncIterator[bytes]:
+        if cached_result is not None:
+            logger.info("Serving cached answer for session %s", session_id)
+            events = iter([
+                {"token": cached_result["answer"]},
+                {
+                    "done": True,
+                    "sources": cached_result.get("sources", []),
+                    "confidence": cached_result.get("confidence", 0.0)
+                }
+            ])
+        else:
+            logger.info("Streaming answer for session %s", session_id)
+            events = get_answer_stream(query.question, user_id=query.user_id or session_id)
+        
+        answer_parts = []
+        final = {}
+        async for event in iterate_in_pool(events):
+            if "token" in event:
+                answer_parts.append(event["token"])
+            else:
+                final = event
+                event = {**event, "session_id": session_id}
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+        
+        # Update session history once the full answer is known
+        result = {
+            "answer": "".join(answer_parts),
+            "sources": final.get("sources", []),
+            "confidence": final.get("confidence", 0.0)
+        }
+        add_message(session_data, query.question, result["answer"])
+        await save_exchange(
+            session_id,
+            session_data,
+            qhash,
+            result if cached_result is None else None
+        )
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @app.get("/sessions/{session_id}")
 async def get_session_endpoint(session_id: str):
     """Get session history"""
-    session_data = get_session(session_id)
+    session_data = await get_session(session_id)
     
     if not session_data:
         raise HTTPException(
@@ -312,13 +772,13 @@ async def get_session_endpoint(session_id: str):
             detail="Session not found"
         )
     
-    return session_data
+    return Response(content=session_encoder.encode(session_data), media_type="application/json")
 
 
 @app.delete("/sessions/{session_id}")
 async def delete_session_endpoint(session_id: str):
     """Delete a session"""
-    deleted = delete_session(session_id)
+    deleted = await delete_session(session_id)
     
     if deleted:
         return {"message": "Session deleted successfully"}
@@ -330,10 +790,11 @@ async def delete_session_endpoint(session_id: str):
 
 
 if __name__ == "__main__":
+    # Development server; use `gunicorn app:app -c gunicorn.conf.py` in production
     import uvicorn
     uvicorn.run(
         "app:app",
-        host=settings.api_host,
-        port=settings.api_port,
+        host=API_HOST,
+        port=API_PORT,
         reload=True
     )
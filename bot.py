@@ -2,11 +2,15 @@
 Telegram bot interface for RAG AI Decision Assistant
 Uses modern python-telegram-bot v20+ API
 """
+import asyncio
 import logging
 import os
-from typing import Dict
+import time
+from datetime import timedelta
+from typing import Dict, Optional
 
 from telegram import Update
+from telegram.error import RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -14,13 +18,21 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
-import requests
+import httpx
+import orjson
 
 from config import settings
+from redis_store import close_redis_client, create_redis_client
+
+# Settings resolved once at import
+LOG_LEVEL = getattr(logging, settings.log_level)
+BOT_TOKEN = settings.telegram_bot_token
+API_PORT = settings.api_port
+LOW_CONFIDENCE_THRESHOLD = settings.low_confidence_threshold
 
 # Configure logging
 logging.basicConfig(
-    level=getattr(logging, settings.log_level),
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -29,15 +41,92 @@ logger = logging.getLogger(__name__)
 def get_api_url() -> str:
     """Get API URL based on environment"""
     api_host = os.getenv("API_HOST", "localhost")
-    api_port = settings.api_port
-    return f"http://{api_host}:{api_port}/ask"
+    return f"http://{api_host}:{API_PORT}/ask"
 
 API_URL = get_api_url()
+STREAM_URL = f"{API_URL}/stream"
+API_TIMEOUT = 30.0
+EDIT_INTERVAL = 0.5  # Seconds between message edits while an answer streams in
 
-# In-memory session storage per user (user_id -> session_id)
+# Session storage per user (user_id -> session_id), shared across bot
+# replicas through Redis; the dict is only used when Redis is unavailable
+USER_SESSION_KEY_PREFIX = "tg:"
+USER_SESSION_TTL = 86400  # 24 hours, matches API sessions
+BOT_REDIS_MAX_CONNECTIONS = 16
 user_sessions: Dict[int, str] = {}
 
 
+async def get_user_session(context: ContextTypes.DEFAULT_TYPE, user_id: int) -> Optional[str]:
+    """
+    Get the API session ID for a Telegram user, refreshing its TTL
+    
+    Args:
+        context: Handler context holding the shared Redis client
+        user_id: Telegram user ID
+        
+    Returns:
+        Session ID, or None if the user has no session yet
+    """
+    redis_client = context.application.bot_data.get("redis")
+    
+    if redis_client:
+        try:
+            session_id = await redis_client.getex(
+                f"{USER_SESSION_KEY_PREFIX}{user_id}",
+                ex=USER_SESSION_TTL
+            )
+            if isinstance(session_id, bytes):
+                session_id = session_id.decode()
+            return session_id
+        except Exception as e:
+            logger.error("Error reading from Redis: %s", e)
+            # Fallback to in-memory
+    
+    return user_sessions.get(user_id)
+
+
+async def save_user_session(context: ContextTypes.DEFAULT_TYPE, user_id: int, session_id: str) -> None:
+    """
+    Remember the API session ID for a Telegram user
+    
+    Args:
+        context: Handler context holding the shared Redis client
+        user_id: Telegram user ID
+        session_id: Session ID returned by the API
+    """
+    redis_client = context.application.bot_data.get("redis")
+    
+    if redis_client:
+        try:
+            await redis_client.setex(
+                f"{USER_SESSION_KEY_PREFIX}{user_id}",
+                USER_SESSION_TTL,
+                session_id
+            )
+            return
+        except Exception as e:
+            logger.error("Error writing to Redis: %s", e)
+            # Fallback to in-memory
+    
+    user_sessions[user_id] = session_id
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """
+    Get how long Telegram asked to wait before the next request
+    
+    Args:
+        error: Flood control error raised by a Telegram API call
+    
+    Returns:
+        Wait time in seconds
+    """
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /start command"""
     user = update.effective_user
@@ -49,7 +138,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         f"Начните с вопроса!"
     )
     await update.message.reply_text(welcome_message)
-    logger.info(f"User {user.id} ({user.username}) started the bot")
+    logger.info("User %s (%s) started the bot", user.id, user.username)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -61,7 +150,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     question = update.message.text.strip()
     
     # Get or create session for user
-    session_id = user_sessions.get(user.id)
+    session_id = await get_user_session(context, user.id)
     
     try:
         # Show typing indicator
@@ -77,36 +166,88 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "session_id": session_id
         }
         
-        logger.info(f"User {user.id} asked: {question[:100]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("User %s asked: %s...", user.id, question[:100])
         
-        # Call API
-        response = requests.post(
-            API_URL,
-            json=payload,
-            timeout=30
-        )
-        response.raise_for_status()
+        # Call API and stream the answer into a single Telegram message
+        client: httpx.AsyncClient = context.application.bot_data["http"]
+        answer_parts = []
+        result = {}
+        message = None
+        sent_text = ""
+        last_edit = 0.0
         
-        result = response.json()
+        async with client.stream(
+            "POST",
+            STREAM_URL,
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = orjson.loads(line[6:])
+                if "token" not in event:
+                    result = event
+                    continue
+                
+                answer_parts.append(event["token"])
+                now = time.monotonic()
+                if now - last_edit < EDIT_INTERVAL:
+                    continue
+                text = "".join(answer_parts)
+                if not text.strip() or text == sent_text:
+                    continue
+                # Progress updates are best effort; the final edit below is
+                # what the user is left with
+                try:
+                    if message is None:
+                        message = await update.message.reply_text(text)
+                    else:
+                        await message.edit_text(text)
+                except RetryAfter as e:
+                    retry_after = retry_after_seconds(e)
+                    logger.warning("Telegram flood control, pausing edits for %.0fs", retry_after)
+                    last_edit = now + retry_after
+                    continue
+                except TelegramError as e:
+                    logger.warning("Intermediate edit failed for user %s: %s", user.id, e)
+                    last_edit = now
+                    continue
+                sent_text = text
+                last_edit = now
         
-        # Update session ID
-        user_sessions[user.id] = result.get("session_id", session_id)
+        # Update session ID (only written when the API started a new session)
+        new_session_id = result.get("session_id")
+        if new_session_id and new_session_id != session_id:
+            await save_user_session(context, user.id, new_session_id)
         
         # Extract answer
-        answer = result.get("answer", "Не удалось получить ответ.")
+        answer = "".join(answer_parts) or "Не удалось получить ответ."
         confidence = result.get("confidence", 0.0)
         
         # Format response with confidence indicator
-        if confidence < 0.5:
+        if confidence < LOW_CONFIDENCE_THRESHOLD:
             answer += "\n\n⚠️ Низкая уверенность в ответе. Проверьте информацию в базе знаний."
         
-        # Send answer
-        await update.message.reply_text(answer)
+        # Send final answer, waiting out flood control once if needed
+        for attempt in range(2):
+            try:
+                if message is None:
+                    await update.message.reply_text(answer)
+                elif answer != sent_text:
+                    await message.edit_text(answer)
+                break
+            except RetryAfter as e:
+                if attempt:
+                    raise
+                await asyncio.sleep(retry_after_seconds(e))
         
-        logger.info(f"Answer sent to user {user.id} (confidence: {confidence:.2f})")
+        logger.info("Answer sent to user %s (confidence: %.2f)", user.id, confidence)
         
-    except requests.exceptions.RequestException as e:
-        logger.error(f"API request failed for user {user.id}: {str(e)}")
+    except httpx.HTTPError as e:
+        logger.error("API request failed for user %s: %s", user.id, e)
         error_message = (
             "Извините, произошла ошибка при обработке вашего вопроса. "
             "Пожалуйста, попробуйте еще раз через несколько секунд."
@@ -114,7 +255,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text(error_message)
         
     except Exception as e:
-        logger.error(f"Unexpected error for user {user.id}: {str(e)}")
+        logger.error("Unexpected error for user %s: %s", user.id, e)
         error_message = "Произошла непредвиденная ошибка. Пожалуйста, попробуйте позже."
         await update.message.reply_text(error_message)
 
@@ -136,14 +277,38 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await update.message.reply_text(help_text, parse_mode="Markdown")
 
 
+async def post_init(application: Application) -> None:
+    """Create the shared HTTP and Redis clients once the bot starts"""
+    application.bot_data["redis"] = await create_redis_client(BOT_REDIS_MAX_CONNECTIONS)
+    application.bot_data["http"] = httpx.AsyncClient(
+        timeout=API_TIMEOUT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    )
+
+
+async def post_shutdown(application: Application) -> None:
+    """Close the shared HTTP and Redis clients"""
+    client = application.bot_data.pop("http", None)
+    if client is not None:
+        await client.aclose()
+    await close_redis_client(application.bot_data.pop("redis", None))
+
+
 def main() -> None:
     """Start the bot"""
-    if not settings.telegram_bot_token:
+    if not BOT_TOKEN:
         logger.error("TELEGRAM_BOT_TOKEN not set in environment variables")
         raise ValueError("Telegram bot token is required. Set TELEGRAM_BOT_TOKEN in .env file")
     
     # Create application
-    application = Application.builder().token(settings.telegram_bot_token).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .concurrent_updates(True)
+        .build()
+    )
     
     # Register handlers
     application.add_handler(CommandHandler("start", start))
@@ -154,7 +319,7 @@ def main() -> None:
     
     # Start bot
     logger.info("Starting Telegram bot...")
-    logger.info(f"API URL: {API_URL}")
+    logger.info("API URL: %s", API_URL)
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
@@ -4,7 +4,7 @@ Configuration management for RAG AI Decision Assistant
 import os
 from pathlib import Path
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -39,20 +39,36 @@ class Settings(BaseSettings):
     redis_db: int = 0
     redis_password: Optional[str] = None
     redis_ssl: bool = False
-    redis_decode_responses: bool = True
+    redis_decode_responses: bool = False  # Session payloads are orjson bytes
     
     # API Configuration
     api_host: str = "0.0.0.0"
     api_port: int = 8000
+    cors_origins: List[str] = ["http://localhost:8000", "http://127.0.0.1:8000"]  # JSON list in .env
+    cors_max_age: int = 86400  # Seconds browsers may cache CORS preflight responses
+    rate_limit_per_minute: int = 30  # Questions per user per minute, 0 disables
     
     # RAG Configuration
-    chunk_size: int = 1000
+    chunk_size: int = 1000  # Characters, used when chunk_tokens is 0
     chunk_overlap: int = 100
+    chunk_tokens: int = 200  # Chunk size in embedding-model tokens, 0 for character chunks
+    chunk_overlap_tokens: int = 20
+    min_chunk_tokens: int = 100  # Shorter chunks are merged into the previous one
     top_k_results: int = 3
+    faiss_index_type: str = "flat"  # flat, sq8, hnsw, hnsw_sq8 or ivfpq
+    faiss_nprobe: int = 8  # IVF lists scanned per query (ivfpq only)
+    answer_cache_size: int = 1024  # Answers kept in each worker's in-process cache, 0 disables
+    semantic_cache_threshold: float = 0.97  # Cosine similarity for reusing an answer, 0 disables
+    low_confidence_threshold: float = 0.5  # Telegram bot warns below this answer confidence
+    
+    num_threads: int = 0  # CPU threads per process for FAISS and local embeddings, 0 = cores / WEB_CONCURRENCY
     
     # Data Configuration
     data_dir: str = "knowledge_data"
-    index_file: str = "faiss_index.pkl"
+    index_dir: str = "faiss_index"  # Holds index.faiss, docs.arrow and embeddings.json
+    local_embedding_dtype: str = "float32"  # float32, bfloat16 or float16 (HuggingFace backend)
+    onnx_model_dir: str = "onnx_model"  # Quantized local embedding model (python embeddings.py)
+    embedding_cache_file: str = "embedding_cache.sqlite"  # Chunk vectors reused across ingests, empty disables
     
     # Logging
     log_level: str = "INFO"
@@ -66,5 +82,22 @@ class Settings(BaseSettings):
 # Global settings instance
 settings = Settings()
 
+
+def cpu_threads_per_process() -> int:
+    """
+    Number of compute threads each process should use
+    
+    Without an explicit NUM_THREADS the cores are split between the
+    WEB_CONCURRENCY server workers, so several workers don't each start a
+    thread per core.
+    
+    Returns:
+        Thread count, at least 1
+    """
+    if settings.num_threads > 0:
+        return settings.num_threads
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, (os.cpu_count() or 1) // workers)
+
 # Ensure data directory exists
 Path(settings.data_dir).mkdir(exist_ok=True)
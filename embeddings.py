@@ -0,0 +1,409 @@
+"""
+Embedding model selection shared by ingestion and retrieval
+The backend chosen at ingestion time is recorded next to the index so
+queries are embedded with the same model
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from config import cpu_threads_per_process, settings
+
+# Try to import sentence transformers for local embeddings
+try:
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    import torch
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+
+# Try to import Hugging Face tokenizers for local models
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+# Try to import ONNX Runtime for quantized local embeddings
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = TRANSFORMERS_AVAILABLE
+except ImportError:
+    ONNX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Multilingual model that supports both English and Russian
+LOCAL_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDINGS_INFO_FILE = "embeddings.json"
+ONNX_MODEL_FILE = "model_quantized.onnx"
+LOCAL_MAX_TOKENS = 128  # max_seq_length of the sentence-transformers model
+OPENAI_MAX_TOKENS = 8191  # Input limit of OpenAI embedding models
+EMBED_BATCH_SIZE = 256
+LOCAL_EMBEDDING_DTYPES = ("float32", "bfloat16", "float16")  # Weight dtypes for the HuggingFace backend
+
+# Cosine similarity of the best retrieved chunk mapped to confidence 0 and 1.
+# OpenAI text-embedding-3 similarities run much lower than MiniLM ones, so a
+# relevant passage often scores under 0.5 there
+SIMILARITY_RANGES: Dict[str, Tuple[float, float]] = {
+    "openai": (0.15, 0.6),
+    "huggingface": (0.25, 0.8),
+    "onnx": (0.25, 0.8),
+}
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Local embeddings from an int8-quantized ONNX export of the
+    sentence-transformers model (mean pooling, L2-normalized)
+    """
+    
+    def __init__(self, model_dir: str):
+        model_path = Path(model_dir) / ONNX_MODEL_FILE
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = cpu_threads_per_process()
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+    
+    def _run(self, encoded: Dict[str, np.ndarray]) -> np.ndarray:
+        inputs = {name: value for name, value in encoded.items() if name in self.input_names}
+        # The BERT graph takes token_type_ids but the XLM-R tokenizer doesn't produce them
+        if "token_type_ids" in self.input_names and "token_type_ids" not in inputs:
+            inputs["token_type_ids"] = np.zeros_like(encoded["input_ids"])
+        hidden = self.session.run(None, inputs)[0]
+        
+        # Mean pooling over real tokens
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        
+        # Tokenize everything in one call, then pad per batch of similar
+        # lengths so short chunks are not padded to the longest one
+        encoded = self.tokenizer(texts, truncation=True, max_length=LOCAL_MAX_TOKENS)
+        order = sorted(range(len(texts)), key=lambda i: len(encoded["input_ids"][i]))
+        
+        vectors: Optional[np.ndarray] = None
+        for start in range(0, len(order), EMBED_BATCH_SIZE):
+            batch_ids = order[start:start + EMBED_BATCH_SIZE]
+            batch = self.tokenizer.pad(
+                {key: [values[i] for i in batch_ids] for key, values in encoded.items()},
+                return_tensors="np"
+            )
+            pooled = self._run(batch)
+            if vectors is None:
+                vectors = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            vectors[batch_ids] = pooled
+        return vectors.tolist()
+    
+    def embed_query(self, text: str) -> List[float]:
+        encoded = self.tokenizer([text], truncation=True, max_length=LOCAL_MAX_TOKENS, return_tensors="np")
+        return self._run(encoded)[0].tolist()
+
+
+def onnx_model_exists() -> bool:
+    """Check whether the quantized ONNX model has been exported"""
+    return (Path(settings.onnx_model_dir) / ONNX_MODEL_FILE).exists()
+
+
+def export_onnx_model(model_dir: str) -> None:
+    """
+    Export the local embedding model to ONNX and quantize it to int8
+    
+    Args:
+        model_dir: Directory to write the quantized model and tokenizer to
+    
+    Raises:
+        ValueError: If the export tools from requirements-onnx.txt are not installed
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError:
+        raise ValueError("ONNX export requires optimum: pip install -r requirements-onnx.txt")
+    
+    logger.info("Exporting %s to ONNX...", LOCAL_EMBEDDING_MODEL)
+    model = ORTModelForFeatureExtraction.from_pretrained(LOCAL_EMBEDDING_MODEL, export=True)
+    tokenizer = AutoTokenizer.from_pretrained(LOCAL_EMBEDDING_MODEL)
+    
+    # Dynamic int8 quantization using AVX-512 VNNI instructions where available
+    quantizer = ORTQuantizer.from_pretrained(model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+    tokenizer.save_pretrained(model_dir)
+    logger.info("Quantized model saved to %s", model_dir)
+
+
+def _upcast_token_embeddings(module, inputs, features: Dict) -> Dict:
+    """Forward hook casting a sentence-transformers Transformer module's output to float32"""
+    features["token_embeddings"] = features["token_embeddings"].float()
+    return features
+
+
+def get_embeddings(backend: str) -> Embeddings:
+    """
+    Create the embeddings object for a backend
+    
+    Args:
+        backend: "openai", "onnx" or "huggingface"
+    
+    Returns:
+        LangChain embeddings instance
+    
+    Raises:
+        ValueError: If the backend is unknown or its dependencies are missing
+    """
+    if backend == "openai":
+        return OpenAIEmbeddings(
+            model=settings.embedding_model,
+            openai_api_key=settings.openai_api_key
+        )
+    
+    if backend == "onnx":
+        if not ONNX_AVAILABLE:
+            raise ValueError(
+                "ONNX embeddings not available. Install onnxruntime: pip install onnxruntime"
+            )
+        return OnnxEmbeddings(settings.onnx_model_dir)
+    
+    if backend == "huggingface":
+        if not SENTENCE_TRANSFORMERS_AVAILABLE:
+            raise ValueError(
+                "Local embeddings not available. Install sentence-transformers: pip install sentence-transformers"
+            )
+        dtype = settings.local_embedding_dtype
+        if dtype not in LOCAL_EMBEDDING_DTYPES:
+            raise ValueError(
+                f"Unknown LOCAL_EMBEDDING_DTYPE '{dtype}', expected one of: {', '.join(LOCAL_EMBEDDING_DTYPES)}"
+            )
+        torch.set_num_threads(cpu_threads_per_process())
+        
+        # Half-precision weights halve memory traffic on bf16/fp16-capable
+        # hardware; no autocast
+        model_kwargs = {}
+        if dtype != "float32":
+            model_kwargs["model_kwargs"] = {"torch_dtype": getattr(torch, dtype)}
+        embeddings = HuggingFaceEmbeddings(
+            model_name=LOCAL_EMBEDDING_MODEL,
+            model_kwargs=model_kwargs,
+            encode_kwargs={"batch_size": EMBED_BATCH_SIZE, "normalize_embeddings": True}
+        )
+        if dtype != "float32":
+            # Upcast the last hidden state so mean pooling and normalization
+            # run in float32 and the returned vectors are float32
+            embeddings.client[0].register_forward_hook(_upcast_token_embeddings)
+        return embeddings
+    
+    raise ValueError(f"Unknown embeddings backend: {backend}")
+
+
+def select_embeddings() -> Tuple[Embeddings, str]:
+    """
+    Pick the embeddings backend for ingestion: OpenAI if a working key is
+    configured, otherwise local HuggingFace embeddings
+    
+    Returns:
+        Tuple of embeddings instance and backend name
+    
+    Raises:
+        ValueError: If no embedding method is available
+    """
+    # Try OpenAI embeddings first
+    if settings.openai_api_key and settings.openai_api_key != "your_openai_api_key_here":
+        try:
+            logger.info("Attempting to use OpenAI embeddings...")
+            embeddings = get_embeddings("openai")
+            # Test the embeddings with a small sample
+            embeddings.embed_query("test")
+            logger.info("OpenAI embeddings working successfully")
+            return embeddings, "openai"
+        except Exception as e:
+            if "429" in str(e) or "quota" in str(e).lower():
+                logger.warning("OpenAI quota exceeded: %s", e)
+                logger.info("Falling back to local embeddings...")
+            else:
+                raise
+    
+    # Use local embeddings if OpenAI failed or not available,
+    # preferring the quantized ONNX model once it has been exported
+    if ONNX_AVAILABLE and onnx_model_exists():
+        logger.info("Using local quantized ONNX embeddings...")
+        return get_embeddings("onnx"), "onnx"
+    
+    if SENTENCE_TRANSFORMERS_AVAILABLE:
+        logger.info("Using local HuggingFace embeddings (sentence-transformers)...")
+        return get_embeddings("huggingface"), "huggingface"
+    
+    raise ValueError(
+        "No embedding method available. Either:\n"
+        "1. Set a valid OPENAI_API_KEY with available quota, or\n"
+        "2. Install sentence-transformers: pip install sentence-transformers"
+    )
+
+
+def get_token_counter(backend: str) -> Tuple[Callable[[str], int], int]:
+    """
+    Get a function counting tokens the way a backend's model does
+    
+    Args:
+        backend: Backend name returned by select_embeddings()
+    
+    Returns:
+        Tuple of token counting function and the most tokens of text the
+        model embeds without truncating
+    
+    Raises:
+        ValueError: If no tokenizer is available for a local backend
+    """
+    if backend == "openai":
+        try:
+            encoding = tiktoken.encoding_for_model(settings.embedding_model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=())), OPENAI_MAX_TOKENS
+    
+    if not TRANSFORMERS_AVAILABLE:
+        raise ValueError("Token-aware chunking requires transformers: pip install transformers")
+    tokenizer = AutoTokenizer.from_pretrained(LOCAL_EMBEDDING_MODEL)
+    # Leave room for the [CLS]/[SEP] tokens added at embedding time
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False)), LOCAL_MAX_TOKENS - 2
+
+
+def embedding_model_id(backend: str) -> str:
+    """Identify the exact model configuration behind a backend's vectors"""
+    if backend == "openai":
+        return f"openai:{settings.embedding_model}"
+    if backend == "huggingface":
+        return f"huggingface:{LOCAL_EMBEDDING_MODEL}:{settings.local_embedding_dtype}:normalized"
+    return f"{backend}:{LOCAL_EMBEDDING_MODEL}"
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper memoizing document vectors in SQLite
+    
+    Vectors are keyed by a hash of the model and the chunk text, so
+    re-ingesting a knowledge base only embeds chunks that changed.
+    Queries are passed through uncached.
+    """
+    
+    def __init__(self, embeddings: Embeddings, model_id: str, cache_file: str):
+        self.embeddings = embeddings
+        self.model_id = model_id.encode()
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+    
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(self.model_id + b"\0" + text.encode(), digest_size=16).digest()
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        cached: Dict[bytes, bytes] = {}
+        for start in range(0, len(keys), EMBED_BATCH_SIZE):
+            batch = keys[start:start + EMBED_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            cached.update(self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch
+            ))
+        
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = self.embeddings.embed_documents([texts[i] for i in missing])
+            rows = [
+                (keys[i], np.asarray(vector, dtype=np.float32).tobytes())
+                for i, vector in zip(missing, vectors)
+            ]
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", rows)
+            cached.update(rows)
+        
+        return [np.frombuffer(cached[key], dtype=np.float32).tolist() for key in keys]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+    
+    def close(self) -> None:
+        self.conn.close()
+
+
+def save_embeddings_info(index_dir: str, backend: str) -> None:
+    """
+    Record which embeddings backend built the index
+    
+    Args:
+        index_dir: Directory holding the saved index
+        backend: Backend name returned by select_embeddings()
+    """
+    info = {
+        "backend": backend,
+        "model": settings.embedding_model if backend == "openai" else LOCAL_EMBEDDING_MODEL
+    }
+    with open(Path(index_dir) / EMBEDDINGS_INFO_FILE, "w", encoding="utf-8") as f:
+        json.dump(info, f)
+
+
+def read_index_backend(index_dir: str) -> str:
+    """
+    Get the embeddings backend a saved index was built with
+    
+    Args:
+        index_dir: Directory holding the saved index
+    
+    Returns:
+        Backend name, "huggingface" for indexes without embeddings.json
+    """
+    info_path = Path(index_dir) / EMBEDDINGS_INFO_FILE
+    info: Dict[str, str] = {}
+    if info_path.exists():
+        with open(info_path, "r", encoding="utf-8") as f:
+            info = json.load(f)
+    return info.get("backend", "huggingface")
+
+
+def load_index_embeddings(index_dir: str) -> Embeddings:
+    """
+    Create the embeddings object matching a saved index
+    
+    Args:
+        index_dir: Directory holding the saved index
+    
+    Returns:
+        LangChain embeddings instance
+    """
+    return get_embeddings(read_index_backend(index_dir))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=getattr(logging, settings.log_level))
+    export_onnx_model(settings.onnx_model_dir)
+    
+    # Smoke test: the exported model must embed a query and a batch end to end
+    onnx_embeddings = OnnxEmbeddings(settings.onnx_model_dir)
+    query_vector = onnx_embeddings.embed_query("Как улучшить подачу в волейболе?")
+    document_vectors = onnx_embeddings.embed_documents(["Serve practice", "Block timing and footwork drills"])
+    if len(document_vectors) != 2 or len(document_vectors[0]) != len(query_vector):
+        raise RuntimeError("Exported ONNX model returned unexpected embedding shapes")
+    print(f"ONNX model exported to {settings.onnx_model_dir} ({len(query_vector)}-dim embeddings)")
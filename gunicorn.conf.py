@@ -0,0 +1,24 @@
+"""
+Gunicorn configuration for production deployment of the FastAPI app
+Run with: gunicorn app:app -c gunicorn.conf.py
+"""
+import os
+
+from config import settings
+
+# Server socket
+bind = f"{settings.api_host}:{settings.api_port}"
+keepalive = 5
+
+# Worker processes (uvloop and httptools are picked up automatically when installed)
+workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+# Workers size their FAISS/embedding thread pools from this (see config.py)
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn_worker.UvicornWorker"
+timeout = 120  # LLM calls can take several seconds
+
+# Import the app (and its LangChain/FAISS modules) once in the master so
+# import errors fail fast and the imported code is shared copy-on-write.
+# The index and embedding model are loaded per worker at startup; the
+# index files are memory-mapped, so their vector codes share the page cache
+preload_app = True
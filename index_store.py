@@ -0,0 +1,158 @@
+"""
+On-disk layout of the knowledge base index shared by ingestion and retrieval
+Vectors live in a native FAISS file and chunk texts in an uncompressed Arrow
+file; the vector codes and texts are memory-mapped on load and no Python
+objects are unpickled
+"""
+import logging
+from pathlib import Path
+from typing import Iterator, Mapping, Union
+
+import faiss
+import orjson
+import pyarrow as pa
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from embeddings import load_index_embeddings, save_embeddings_info
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.faiss"
+DOCS_FILE = "docs.arrow"
+MMAP_FLAGS = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+
+
+class ArrowDocstore(Docstore):
+    """
+    Read-only docstore over memory-mapped Arrow columns
+    
+    Document IDs are row numbers, matching the position of each vector in
+    the FAISS index; a Document is only built when a row is looked up.
+    """
+    
+    def __init__(self, table: pa.Table):
+        self.texts = table.column("text")
+        self.metadata = table.column("metadata")
+    
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    def search(self, search: str) -> Union[str, Document]:
+        try:
+            row = int(search)
+        except ValueError:
+            return f"ID {search} not found."
+        if not 0 <= row < len(self.texts):
+            return f"ID {search} not found."
+        return Document(
+            page_content=self.texts[row].as_py(),
+            metadata=orjson.loads(self.metadata[row].as_py())
+        )
+
+
+class RowIds(Mapping):
+    """
+    Read-only index_to_docstore_id for an ArrowDocstore: vector i maps to
+    document ID str(i), without building a dict of ntotal entries
+    """
+    
+    def __init__(self, ntotal: int):
+        self.ntotal = ntotal
+    
+    def __getitem__(self, row: int) -> str:
+        row = int(row)
+        if not 0 <= row < self.ntotal:
+            raise KeyError(row)
+        return str(row)
+    
+    def __len__(self) -> int:
+        return self.ntotal
+    
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.ntotal))
+
+
+def save_index(vector_store: FAISS, index_dir: str, backend: str) -> None:
+    """
+    Write the vector store to disk
+    
+    Args:
+        vector_store: Vector store built during ingestion
+        index_dir: Directory to write the index to
+        backend: Embeddings backend name returned by select_embeddings()
+    """
+    path = Path(index_dir)
+    path.mkdir(parents=True, exist_ok=True)
+    faiss.write_index(vector_store.index, str(path / INDEX_FILE))
+    
+    # Chunk rows in vector order so row numbers double as document IDs
+    texts = []
+    metadata = []
+    for row in range(vector_store.index.ntotal):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[row])
+        texts.append(doc.page_content)
+        metadata.append(orjson.dumps(doc.metadata).decode())
+    table = pa.table({
+        "text": pa.array(texts, type=pa.large_string()),
+        "metadata": pa.array(metadata, type=pa.large_string())
+    })
+    with pa.OSFile(str(path / DOCS_FILE), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    
+    save_embeddings_info(index_dir, backend)
+    
+    # Pickled docstore written by earlier versions
+    (path / "index.pkl").unlink(missing_ok=True)
+
+
+def load_index(index_dir: str) -> FAISS:
+    """
+    Load a vector store written by save_index()
+    
+    Args:
+        index_dir: Directory holding the index
+    
+    Returns:
+        FAISS vector store backed by memory-mapped files
+    
+    Raises:
+        FileNotFoundError: If the index files don't exist
+    """
+    path = Path(index_dir)
+    index_path = path / INDEX_FILE
+    docs_path = path / DOCS_FILE
+    
+    if not index_path.exists() or not docs_path.exists():
+        raise FileNotFoundError(
+            f"Index '{index_dir}' not found. "
+            "Please run ingest.py first to create the knowledge base index."
+        )
+    
+    # Memory-map the vector codes so workers share the page cache instead of
+    # each holding a private copy: IO_FLAG_MMAP_IFC covers flat-code storage
+    # (flat, sq8 and the storage under hnsw*), IO_FLAG_MMAP covers IVF lists.
+    # HNSW graph links are always read into memory.
+    try:
+        index = faiss.read_index(str(index_path), MMAP_FLAGS)
+    except RuntimeError as e:
+        logger.warning("Memory-mapped index load failed (%s), reading into memory", e)
+        index = faiss.read_index(str(index_path))
+    
+    # Uncompressed Arrow IPC reads are zero-copy views of the mapped file
+    table = pa.ipc.open_file(pa.memory_map(str(docs_path), "r")).read_all()
+    docstore = ArrowDocstore(table)
+    if len(docstore) != index.ntotal:
+        raise ValueError(
+            f"Index '{index_dir}' is inconsistent ({index.ntotal} vectors, {len(docstore)} documents). "
+            "Please run ingest.py again."
+        )
+    
+    return FAISS(
+        embedding_function=load_index_embeddings(index_dir),
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=RowIds(index.ntotal)
+    )
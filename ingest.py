@@ -4,24 +4,30 @@ Supports PDF, DOCX, and text files in Russian and English
 """
 import os
 import logging
-import pickle
+import math
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import List
+from typing import Callable, Iterator, List, Tuple
+import faiss
 import pdfplumber
 from docx import Document
 
+from langchain_core.documents import Document as LCDocument
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
 
-from config import settings
-
-# Try to import sentence transformers for local embeddings
+# Try to import PDFium for fast PDF text extraction
 try:
-    from langchain_community.embeddings import HuggingFaceEmbeddings
-    SENTENCE_TRANSFORMERS_AVAILABLE = True
+    import pypdfium2 as pdfium
+    PDFIUM_AVAILABLE = True
 except ImportError:
-    SENTENCE_TRANSFORMERS_AVAILABLE = False
+    PDFIUM_AVAILABLE = False
+
+from config import settings
+from embeddings import CachedEmbeddings, embedding_model_id, get_token_counter, select_embeddings
+from index_store import save_index
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +36,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+HNSW_M = 32  # Graph neighbours per node
+PQ_NBITS = 8  # Bits per product quantizer sub-code
+PQ_MIN_TRAINING_POINTS = 1 << PQ_NBITS  # One point per PQ centroid at least
+INGEST_BATCH_SIZE = 256  # Chunks embedded and added to the index at a time
+
+
+def _load_pdf_pdfium(file_path: str) -> str:
+    """Extract text from a PDF with the PDFium engine"""
+    parts = []
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            page_text = textpage.get_text_bounded()
+            textpage.close()
+            page.close()
+            if page_text.strip():
+                parts.append(page_text)
+    finally:
+        pdf.close()
+    return "\n".join(parts)
+
+
+def _load_pdf(file_path: str) -> str:
+    """
+    Extract text from a PDF page by page
+    
+    PDFium is tried first as it is several times faster; pdfplumber is
+    used when it is unavailable, fails or finds no text.
+    """
+    if PDFIUM_AVAILABLE:
+        try:
+            text = _load_pdf_pdfium(file_path)
+            if text.strip():
+                return text
+        except Exception as e:
+            logger.warning("PDFium could not read %s (%s), falling back to pdfplumber", file_path, e)
+    
+    parts = []
+    with pdfplumber.open(file_path) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text()
+            if page_text:
+                parts.append(page_text)
+    return "\n".join(parts)
+
+
+def _load_docx(file_path: str) -> str:
+    """Extract the non-empty paragraphs of a DOCX file"""
+    doc = Document(file_path)
+    return "\n".join(para.text for para in doc.paragraphs if para.text.strip())
+
+
+def _load_plain_text(file_path: str) -> str:
+    """Read a UTF-8 text or Markdown file"""
+    with open(file_path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+# File suffix -> (description for logging, loader)
+_LOADERS = {
+    ".pdf": ("PDF", _load_pdf),
+    ".docx": ("DOCX", _load_docx),
+    ".txt": ("text file", _load_plain_text),
+    ".md": ("text file", _load_plain_text),
+}
+
 
 def load_text(file_path: str) -> str:
     """
@@ -45,41 +118,231 @@ def load_text(file_path: str) -> str:
     Raises:
         Exception: If file cannot be read or processed
     """
-    text = ""
-    file_path_obj = Path(file_path)
+    loader = _LOADERS.get(Path(file_path).suffix.lower())
+    if loader is None:
+        logger.warning("Unsupported file type: %s", file_path)
+        return ""
     
+    kind, load = loader
     try:
-        if file_path.endswith(".pdf"):
-            logger.info(f"Loading PDF: {file_path}")
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-        elif file_path.endswith(".docx"):
-            logger.info(f"Loading DOCX: {file_path}")
-            doc = Document(file_path)
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    text += para.text + "\n"
-        elif file_path.endswith((".txt", ".md")):
-            logger.info(f"Loading text file: {file_path}")
-            with open(file_path, "r", encoding="utf-8") as f:
-                text = f.read()
-        else:
-            logger.warning(f"Unsupported file type: {file_path}")
-            return ""
-            
+        logger.info("Loading %s: %s", kind, file_path)
+        text = load(file_path)
+        
         if not text.strip():
-            logger.warning(f"No text extracted from {file_path}")
+            logger.warning("No text extracted from %s", file_path)
             
         return text
         
     except Exception as e:
-        logger.error(f"Error loading {file_path}: {str(e)}")
+        logger.error("Error loading %s: %s", file_path, e)
         raise
 
 
+def iter_texts(files: List[Path]) -> Iterator[Tuple[Path, str]]:
+    """
+    Extract text from files in parallel, yielding it in file order
+    
+    Only a few files are extracted ahead of the consumer, so the whole
+    corpus is never held in memory at once. Files that fail to load are
+    logged and skipped.
+    
+    Args:
+        files: Files to load
+        
+    Yields:
+        (file path, text) for each file with non-empty text
+    """
+    workers = min(len(files), os.cpu_count() or 1)
+    remaining = iter(files)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(
+            (file_path, executor.submit(load_text, str(file_path)))
+            for file_path in islice(remaining, workers * 2)
+        )
+        while pending:
+            file_path, future = pending.popleft()
+            next_file = next(remaining, None)
+            if next_file is not None:
+                pending.append((next_file, executor.submit(load_text, str(next_file))))
+            
+            try:
+                text = future.result()
+            except Exception as e:
+                logger.error("Failed to load %s: %s", file_path.name, e)
+                continue
+            if text.strip():
+                logger.info("Successfully loaded %s (%s characters)", file_path.name, len(text))
+                yield file_path, text
+
+
+def _strip_overlap(previous: str, chunk: str) -> str:
+    """
+    Drop the start of a chunk that repeats the end of the previous one
+    
+    The text splitter carries whole words of one chunk over into the next,
+    so only an overlap that begins and ends on a word boundary is removed.
+    
+    Args:
+        previous: Preceding chunk
+        chunk: Chunk following it
+        
+    Returns:
+        The chunk without the repeated text
+    """
+    for size in range(min(len(previous), len(chunk)), 0, -1):
+        if (
+            (size == len(previous) or previous[-size - 1].isspace())
+            and (size == len(chunk) or chunk[size].isspace())
+            and previous.endswith(chunk[:size])
+        ):
+            return chunk[size:].lstrip()
+    return chunk
+
+
+def make_chunker(backend: str) -> Callable[[str], List[str]]:
+    """
+    Build the function that splits a document's text into chunks
+    
+    Chunks are measured in tokens of the embedding model (CHUNK_TOKENS),
+    capped at what the model embeds without truncation, and chunks shorter
+    than MIN_CHUNK_TOKENS are merged into the previous one (without the
+    overlap they share) when the result still fits in CHUNK_TOKENS.
+    With CHUNK_TOKENS=0 the character-based CHUNK_SIZE is used instead.
+    
+    Args:
+        backend: Backend name returned by select_embeddings()
+        
+    Returns:
+        Function mapping a text to its chunks
+    """
+    if settings.chunk_tokens <= 0:
+        return RecursiveCharacterTextSplitter(
+            chunk_size=settings.chunk_size,
+            chunk_overlap=settings.chunk_overlap,
+            length_function=len
+        ).split_text
+    
+    count_tokens, max_tokens = get_token_counter(backend)
+    chunk_tokens = min(settings.chunk_tokens, max_tokens)
+    min_tokens = min(settings.min_chunk_tokens, chunk_tokens // 2)
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens,
+        chunk_overlap=min(settings.chunk_overlap_tokens, chunk_tokens // 2),
+        length_function=count_tokens
+    )
+    logger.info("Chunking to %d tokens (merging chunks under %d)", chunk_tokens, min_tokens)
+    
+    def split(text: str) -> List[str]:
+        chunks: List[str] = []
+        sizes: List[int] = []
+        for chunk in text_splitter.split_text(text):
+            size = count_tokens(chunk)
+            if chunks and (size < min_tokens or sizes[-1] < min_tokens):
+                rest = _strip_overlap(chunks[-1], chunk)
+                merged = f"{chunks[-1]}\n{rest}" if rest else chunks[-1]
+                merged_size = count_tokens(merged)
+                if merged_size <= chunk_tokens:
+                    chunks[-1] = merged
+                    sizes[-1] = merged_size
+                    continue
+            chunks.append(chunk)
+            sizes.append(size)
+        return chunks
+    
+    return split
+
+
+def iter_chunks(
+    files: List[Path],
+    split: Callable[[str], List[str]]
+) -> Iterator[LCDocument]:
+    """
+    Lazily split every file into chunk documents
+    
+    Args:
+        files: Files to load
+        split: Chunking function from make_chunker()
+        
+    Yields:
+        One document per chunk, with the file name as its 'source' metadata
+    """
+    for file_path, text in iter_texts(files):
+        for chunk in split(text):
+            yield LCDocument(page_content=chunk, metadata={"source": file_path.name})
+
+
+def build_ann_index(index: faiss.Index, index_type: str) -> faiss.Index:
+    """
+    Rebuild a flat FAISS index as an approximate nearest neighbour index
+    
+    Args:
+        index: Flat index holding every chunk embedding
+        index_type: "flat", "sq8", "hnsw", "hnsw_sq8" or "ivfpq"
+    
+    Returns:
+        New index with the same vectors and metric, or the original index
+        for "flat" and for corpora too small to train IVF-PQ
+    
+    Raises:
+        ValueError: If the index type is unknown
+    """
+    index_type = index_type.lower()
+    if index_type == "flat":
+        return index
+    
+    d = index.d
+    ntotal = index.ntotal
+    xb = index.reconstruct_n(0, ntotal)
+    
+    # int8 scalar quantization: 4x smaller corpus vectors, queries stay float32
+    if index_type == "sq8":
+        sq_index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, index.metric_type)
+        sq_index.train(xb)
+        sq_index.add(xb)
+        logger.info("Built int8 scalar quantized index over %d vectors", ntotal)
+        return sq_index
+    
+    if index_type == "hnsw_sq8":
+        ann_index = faiss.IndexHNSWSQ(d, faiss.ScalarQuantizer.QT_8bit, HNSW_M, index.metric_type)
+        ann_index.train(xb)
+        ann_index.add(xb)
+        logger.info("Built HNSW index (M=%d) with int8 vectors over %d vectors", HNSW_M, ntotal)
+        return ann_index
+    
+    if index_type == "hnsw":
+        ann_index = faiss.IndexHNSWFlat(d, HNSW_M, index.metric_type)
+        ann_index.add(xb)
+        logger.info("Built HNSW index (M=%d) over %d vectors", HNSW_M, ntotal)
+        return ann_index
+    
+    if index_type == "ivfpq":
+        nlist = max(32, int(4 * math.sqrt(ntotal)))
+        if ntotal < max(nlist, PQ_MIN_TRAINING_POINTS):
+            logger.warning(
+                "Only %d vectors, too few to train IVF-PQ (nlist=%d); keeping flat index",
+                ntotal, nlist
+            )
+            return index
+        
+        # PQ needs a sub-quantizer count that divides the dimension
+        m = min(64, max(1, d // 4))
+        while d % m:
+            m -= 1
+        
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            quantizer = faiss.IndexFlatIP(d)
+        else:
+            quantizer = faiss.IndexFlatL2(d)
+        ann_index = faiss.IndexIVFPQ(quantizer, d, nlist, m, PQ_NBITS, index.metric_type)
+        ann_index.train(xb)
+        ann_index.add(xb)
+        ann_index.nprobe = settings.faiss_nprobe
+        logger.info("Built IVF-PQ index (nlist=%d, m=%d) over %d vectors", nlist, m, ntotal)
+        return ann_index
+    
+    raise ValueError(f"Unknown FAISS index type: {index_type}")
+
+
 def ingest_knowledge_base() -> None:
     """
     Main ingestion function: loads documents, chunks them, creates embeddings,
@@ -98,10 +361,9 @@ def ingest_knowledge_base() -> None:
         )
     
     # Get all supported files
-    supported_extensions = {".pdf", ".docx", ".txt", ".md"}
     files = [
         f for f in data_dir.iterdir()
-        if f.is_file() and f.suffix.lower() in supported_extensions
+        if f.is_file() and f.suffix.lower() in _LOADERS
     ]
     
     if not files:
@@ -110,95 +372,57 @@ def ingest_knowledge_base() -> None:
             f"Supported formats: PDF, DOCX, TXT, MD"
         )
     
-    logger.info(f"Found {len(files)} files to process")
-    
-    # Load all documents
-    all_texts = []
-    for file_path in files:
-        try:
-            text = load_text(str(file_path))
-            if text.strip():
-                all_texts.append(text)
-                logger.info(f"Successfully loaded {file_path.name} ({len(text)} characters)")
-        except Exception as e:
-            logger.error(f"Failed to load {file_path.name}: {str(e)}")
-            continue
-    
-    if not all_texts:
-        raise ValueError("No text content could be extracted from any files")
-    
-    # Chunk text
-    logger.info("Chunking documents...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.chunk_size,
-        chunk_overlap=settings.chunk_overlap,
-        length_function=len
-    )
-    
-    docs = []
-    for text in all_texts:
-        chunks = text_splitter.split_text(text)
-        docs.extend(chunks)
-    
-    logger.info(f"Created {len(docs)} text chunks")
+    logger.info("Found %s files to process", len(files))
     
-    if not docs:
-        raise ValueError("No text chunks created from documents")
-    
-    # Create embeddings and vector store
-    logger.info("Creating embeddings and vector store...")
+    # Stream file -> text -> chunks -> embeddings -> index, holding only one
+    # batch of chunks at a time
+    logger.info("Chunking documents and creating embeddings...")
+    embedding_cache = None
     try:
-        embeddings = None
-        use_local_embeddings = False
+        embeddings, embeddings_backend = select_embeddings()
+        if settings.embedding_cache_file:
+            embeddings = embedding_cache = CachedEmbeddings(
+                embeddings,
+                embedding_model_id(embeddings_backend),
+                settings.embedding_cache_file
+            )
         
-        # Try OpenAI embeddings first
-        if settings.openai_api_key and settings.openai_api_key != "your_openai_api_key_here":
-            try:
-                logger.info("Attempting to use OpenAI embeddings...")
-                embeddings = OpenAIEmbeddings(
-                    model=settings.embedding_model,
-                    openai_api_key=settings.openai_api_key
-                )
-                # Test the embeddings with a small sample
-                test_emb = embeddings.embed_query("test")
-                logger.info("OpenAI embeddings working successfully")
-            except Exception as e:
-                if "429" in str(e) or "quota" in str(e).lower():
-                    logger.warning(f"OpenAI quota exceeded: {str(e)}")
-                    logger.info("Falling back to local embeddings...")
-                    use_local_embeddings = True
-                else:
-                    raise
-        
-        # Use local embeddings if OpenAI failed or not available
-        if embeddings is None or use_local_embeddings:
-            if SENTENCE_TRANSFORMERS_AVAILABLE:
-                logger.info("Using local HuggingFace embeddings (sentence-transformers)...")
-                # Use a multilingual model that supports both English and Russian
-                embeddings = HuggingFaceEmbeddings(
-                    model_name="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-                )
+        chunks = iter_chunks(files, make_chunker(embeddings_backend))
+        vector_store = None
+        chunk_count = 0
+        for batch in iter(lambda: list(islice(chunks, INGEST_BATCH_SIZE)), []):
+            if vector_store is None:
+                vector_store = FAISS.from_documents(batch, embeddings)
             else:
-                raise ValueError(
-                    "No embedding method available. Either:\n"
-                    "1. Set a valid OPENAI_API_KEY with available quota, or\n"
-                    "2. Install sentence-transformers: pip install sentence-transformers"
-                )
-        
-        vector_store = FAISS.from_texts(docs, embeddings)
-        logger.info("Vector store created successfully")
+                vector_store.add_documents(batch)
+            chunk_count += len(batch)
+            logger.info("Indexed %s text chunks", chunk_count)
     except Exception as e:
-        logger.error(f"Error creating embeddings: {str(e)}")
+        logger.error("Error creating embeddings: %s", e)
         raise
+    finally:
+        if embedding_cache is not None:
+            logger.info(
+                "Embedding cache: %d chunks reused, %d embedded",
+                embedding_cache.hits, embedding_cache.misses
+            )
+            embedding_cache.close()
+    
+    if vector_store is None:
+        raise ValueError("No text chunks created from documents")
+    
+    logger.info("Created %s text chunks", chunk_count)
+    vector_store.index = build_ann_index(vector_store.index, settings.faiss_index_type)
+    logger.info("Vector store created successfully")
     
-    # Save FAISS index
-    logger.info(f"Saving index to {settings.index_file}...")
+    # Save FAISS index and chunk texts (both readable with a memory map)
+    logger.info("Saving index to %s/...", settings.index_dir)
     try:
-        with open(settings.index_file, "wb") as f:
-            pickle.dump(vector_store, f)
-        logger.info(f"Index saved successfully ({Path(settings.index_file).stat().st_size / 1024 / 1024:.2f} MB)")
+        save_index(vector_store, settings.index_dir, embeddings_backend)
+        size_mb = sum(f.stat().st_size for f in Path(settings.index_dir).iterdir()) / (1 << 20)
+        logger.info("Index saved successfully (%.2f MB)", size_mb)
     except Exception as e:
-        logger.error(f"Error saving index: {str(e)}")
+        logger.error("Error saving index: %s", e)
         raise
     
     logger.info("✅ Knowledge base ingested and indexed successfully")
@@ -209,5 +433,5 @@ if __name__ == "__main__":
         ingest_knowledge_base()
         print("Knowledge base ingestion completed successfully!")
     except Exception as e:
-        logger.error(f"Ingestion failed: {str(e)}")
+        logger.error("Ingestion failed: %s", e)
         exit(1)
@@ -0,0 +1,63 @@
+"""
+Redis connection helpers shared by the API and the Telegram bot
+"""
+import logging
+
+from config import settings
+
+# Redis import with fallback
+try:
+    from redis import asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    logging.warning("Redis not available. Install with: pip install redis")
+
+logger = logging.getLogger(__name__)
+
+REDIS_MAX_CONNECTIONS = 64
+
+
+async def create_redis_client(max_connections: int = REDIS_MAX_CONNECTIONS):
+    """
+    Create async Redis client backed by a shared connection pool
+    
+    Args:
+        max_connections: Upper bound on pooled connections
+        
+    Returns:
+        Connected redis.asyncio.Redis client, or None if Redis is unavailable
+    """
+    if not REDIS_AVAILABLE:
+        return None
+    
+    pool = aioredis.ConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=settings.redis_db,
+        password=settings.redis_password if settings.redis_password else None,
+        connection_class=aioredis.SSLConnection if settings.redis_ssl else aioredis.Connection,
+        decode_responses=settings.redis_decode_responses,
+        max_connections=max_connections,
+        socket_connect_timeout=5,
+        socket_timeout=5,
+        retry_on_timeout=True
+    )
+    
+    try:
+        client = aioredis.Redis(connection_pool=pool)
+        # Test connection
+        await client.ping()
+        logger.info("Connected to Redis at %s:%s", settings.redis_host, settings.redis_port)
+        return client
+    except Exception as e:
+        logger.warning("Redis connection failed: %s. Using in-memory storage.", e)
+        await pool.disconnect()
+        return None
+
+
+async def close_redis_client(client) -> None:
+    """Close a client created by create_redis_client and its pool"""
+    if client is not None:
+        await client.aclose()
+        await client.connection_pool.disconnect()
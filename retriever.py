@@ -2,15 +2,21 @@
 RAG retrieval module for AI Decision Assistant
 Implements strict anti-hallucination controls to ensure answers only from knowledge base
 """
-import pickle
+import asyncio
 import logging
-from pathlib import Path
-from typing import Dict, List, Optional
+import os
+import threading
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+import faiss
+import numpy as np
+from cachetools import LRUCache
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
 # Try to import Gemini
@@ -20,18 +26,97 @@ try:
 except ImportError:
     GEMINI_AVAILABLE = False
 
-from config import settings
+from config import cpu_threads_per_process, settings
+from embeddings import SIMILARITY_RANGES, read_index_backend
+from index_store import load_index
+
+# Settings read on the request path, resolved once at import
+LOG_LEVEL = getattr(logging, settings.log_level)
+TOP_K_RESULTS = settings.top_k_results
+HNSW_EF_SEARCH = 64  # Candidate list size for HNSW queries
+ANSWER_CACHE_SIZE = settings.answer_cache_size
+SEMANTIC_CACHE_THRESHOLD = settings.semantic_cache_threshold
+NUM_THREADS = cpu_threads_per_process()
+MAX_SOURCES = 3  # Sources returned with each answer
+SOURCE_PREVIEW_CHARS = 200
 
 # Configure logging
 logging.basicConfig(
-    level=getattr(logging, settings.log_level),
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
+# CPU threads for FAISS search; the HF tokenizers read their setting lazily
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+faiss.omp_set_num_threads(NUM_THREADS)
+
+
+class AnswerCache:
+    """
+    Two-tier answer cache: an exact LRU on the normalized question, and a
+    semantic tier matching recent query embeddings by cosine similarity
+    
+    A maxsize of 0 disables both tiers.
+    """
+    
+    def __init__(self, maxsize: int, threshold: float):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.exact: LRUCache = LRUCache(maxsize=maxsize)
+        self.vectors: Optional[np.ndarray] = None  # Ring buffer of unit query vectors
+        self.answers: List[Optional[Dict[str, Any]]] = [None] * maxsize
+        self.next_slot = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(question.lower().split())
+    
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """Look up an answer for exactly this question"""
+        if self.maxsize <= 0:
+            return None
+        with self.lock:
+            result = self.exact.get(self.normalize(question))
+        return dict(result) if result is not None else None
+    
+    def get_similar(self, vector: List[float]) -> Optional[Dict[str, Any]]:
+        """Look up an answer for a question whose embedding is close enough"""
+        if self.maxsize <= 0 or self.threshold <= 0:
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != query.shape[0]:
+                return None
+            scores = self.vectors @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold or self.answers[best] is None:
+                return None
+            return dict(self.answers[best])
+    
+    def put(self, question: str, vector: List[float], result: Dict[str, Any]) -> None:
+        """Store an answer under its question and query embedding"""
+        if self.maxsize <= 0:
+            return
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        with self.lock:
+            self.exact[self.normalize(question)] = result
+            if self.vectors is None or self.vectors.shape[1] != query.shape[0]:
+                self.vectors = np.zeros((self.maxsize, query.shape[0]), dtype=np.float32)
+                self.answers = [None] * self.maxsize
+            self.vectors[self.next_slot] = query
+            self.answers[self.next_slot] = result
+            self.next_slot = (self.next_slot + 1) % self.maxsize
+
+
 # Global variables for lazy loading
 _vector_store: Optional[FAISS] = None
+_similarity_range: Tuple[float, float] = SIMILARITY_RANGES["huggingface"]
 _qa_chain: Optional[object] = None
+_answer_cache = AnswerCache(ANSWER_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD)
 
 
 def load_vector_store() -> FAISS:
@@ -42,30 +127,36 @@ def load_vector_store() -> FAISS:
         FAISS vector store instance
         
     Raises:
-        FileNotFoundError: If index file doesn't exist
+        FileNotFoundError: If the index directory doesn't exist
         Exception: If loading fails
     """
-    global _vector_store
+    global _vector_store, _similarity_range
     
     if _vector_store is not None:
         return _vector_store
     
-    index_path = Path(settings.index_file)
-    
-    if not index_path.exists():
-        raise FileNotFoundError(
-            f"Index file '{settings.index_file}' not found. "
-            "Please run ingest.py first to create the knowledge base index."
-        )
-    
     try:
-        logger.info(f"Loading vector store from {settings.index_file}...")
-        with open(settings.index_file, "rb") as f:
-            _vector_store = pickle.load(f)
-        logger.info("Vector store loaded successfully")
+        logger.info("Loading vector store from %s...", settings.index_dir)
+        vector_store = load_index(settings.index_dir)
+        
+        # Search-time parameters are not part of the stored index
+        index = vector_store.index
+        if isinstance(index, faiss.IndexIVF):
+            index.nprobe = settings.faiss_nprobe
+        elif isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = max(HNSW_EF_SEARCH, TOP_K_RESULTS)
+        
+        _similarity_range = SIMILARITY_RANGES.get(
+            read_index_backend(settings.index_dir),
+            SIMILARITY_RANGES["huggingface"]
+        )
+        _vector_store = vector_store
+        logger.info("Vector store loaded successfully (%d vectors)", index.ntotal)
         return _vector_store
+    except FileNotFoundError:
+        raise
     except Exception as e:
-        logger.error(f"Error loading vector store: {str(e)}")
+        logger.error("Error loading vector store: %s", e)
         raise
 
 
@@ -84,12 +175,6 @@ def get_qa_chain():
     try:
         vector_store = load_vector_store()
         
-        # Create retriever
-        retriever = vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": settings.top_k_results}
-        )
-        
         # Anti-hallucination system prompt
         # This ensures the model only answers based on retrieved context
         prompt_template = """You are a specialized AI decision assistant for volleyball athletes. 
@@ -147,31 +232,324 @@ Answer (based ONLY on the context above):"""
                 base_url=settings.openai_base_url
             )
         
-        # Create QA chain using LangChain 1.x API
-        def format_docs(docs):
-            return "\n\n".join(doc.page_content for doc in docs)
-        
-        rag_chain = (
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
-            | PROMPT
-            | llm
-            | StrOutputParser()
-        )
+        # Create QA chain using LangChain 1.x API; retrieval happens outside
+        # the chain so each question is embedded exactly once
+        generate_chain = PROMPT | llm | StrOutputParser()
         
         _qa_chain = {
-            "chain": rag_chain,
-            "retriever": retriever
+            "generate": generate_chain,
+            "vector_store": vector_store
         }
         
         logger.info("QA chain initialized successfully")
         return _qa_chain
         
     except Exception as e:
-        logger.error(f"Error initializing QA chain: {str(e)}")
+        logger.error("Error initializing QA chain: %s", e)
         raise
 
 
-def get_answer(question: str, user_id: Optional[str] = None) -> Dict[str, any]:
+def format_docs(docs: List[Document]) -> str:
+    """Join retrieved documents into the prompt context"""
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+@dataclass(frozen=True, slots=True)
+class Source:
+    """
+    Preview of one retrieved document returned alongside an answer
+    
+    orjson and pydantic serialize it as a plain JSON object, so responses
+    keep the same shape as a dictionary while answers share one immutable
+    instance between caches and responses.
+    """
+    content_preview: str
+    metadata: Dict[str, Any]
+
+
+def format_sources(source_documents: List[Document]) -> List[Source]:
+    """
+    Build the source previews returned alongside an answer
+    
+    Args:
+        source_documents: Retrieved LangChain documents
+        
+    Returns:
+        List of Source previews with 'content_preview' and 'metadata' fields
+    """
+    sources = []
+    for doc in source_documents[:MAX_SOURCES]:
+        content = doc.page_content
+        if len(content) > SOURCE_PREVIEW_CHARS:
+            content = content[:SOURCE_PREVIEW_CHARS] + "..."
+        sources.append(Source(content, doc.metadata))
+    return sources
+
+
+def search_by_vectors(
+    vector_store: FAISS,
+    vectors: List[List[float]],
+    k: int
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Search the index for several query vectors with a single FAISS call
+    
+    Args:
+        vector_store: Loaded FAISS vector store
+        vectors: Query embeddings
+        k: Number of results per query
+        
+    Returns:
+        For each query, a list of (document, distance) pairs
+    """
+    query_matrix = np.asarray(vectors, dtype=np.float32)
+    if vector_store._normalize_L2:
+        faiss.normalize_L2(query_matrix)
+    distances, indices = vector_store.index.search(query_matrix, k)
+    
+    results = []
+    for row_distances, row_indices in zip(distances, indices):
+        hits = []
+        for distance, index in zip(row_distances, row_indices):
+            if index == -1:
+                continue
+            doc = vector_store.docstore.search(vector_store.index_to_docstore_id[index])
+            if isinstance(doc, Document):
+                hits.append((doc, float(distance)))
+        results.append(hits)
+    return results
+
+
+def confidence_from_hits(vector_store: FAISS, hits: List[Tuple[Document, float]]) -> float:
+    """
+    Turn the best search hit into a confidence score
+    
+    All embedding backends produce unit-length vectors, so inner product
+    is the cosine similarity and a squared L2 distance d maps to 1 - d / 2.
+    The cosine is then rescaled over the backend's SIMILARITY_RANGES entry,
+    so the same confidence means the same thing for every backend.
+    
+    Args:
+        vector_store: Vector store the hits came from
+        hits: (document, distance) pairs from search_by_vectors(), best first
+        
+    Returns:
+        Calibrated confidence in [0, 1], or 0.0 without hits
+    """
+    if not hits:
+        return 0.0
+    score = hits[0][1]
+    if vector_store.index.metric_type != faiss.METRIC_INNER_PRODUCT:
+        score = 1.0 - score / 2.0
+    low, high = _similarity_range
+    return min(1.0, max(0.0, (score - low) / (high - low)))
+
+
+def _empty_result(answer: str) -> Dict[str, Any]:
+    """Build an answer dictionary without sources"""
+    return {
+        "answer": answer,
+        "sources": [],
+        "confidence": 0.0
+    }
+
+
+# One question still needing an LLM answer: (position in batch, question,
+# query embedding, retrieved (document, distance) pairs)
+PendingQuestion = Tuple[int, str, List[float], List[Tuple[Document, float]]]
+
+
+def _prepare_batch(
+    questions: List[str],
+    results: List[Optional[Dict[str, Any]]]
+) -> List[PendingQuestion]:
+    """
+    Answer what can be answered without the LLM and retrieve documents for
+    the rest
+    
+    Invalid and cached questions are filled into results in place. Query
+    embedding and vector search run as a single batch.
+    
+    Args:
+        questions: User questions
+        results: One slot per question, filled in place
+        
+    Returns:
+        Questions still to be answered by the LLM, with their documents
+    """
+    pending = []
+    for i, question in enumerate(questions):
+        if not question or not question.strip():
+            results[i] = _empty_result("Please provide a valid question.")
+            continue
+        results[i] = _answer_cache.get(question)
+        if results[i] is None:
+            pending.append(i)
+    
+    if not pending:
+        return []
+    
+    logger.info("Processing batch of %d questions", len(pending))
+    vector_store = get_qa_chain()["vector_store"]
+    pending_questions = [questions[i] for i in pending]
+    
+    # Embed the whole batch, then answer near-duplicates of recent questions from cache
+    query_vectors = vector_store.embeddings.embed_documents(pending_questions)
+    misses = []
+    for i, question, vector in zip(pending, pending_questions, query_vectors):
+        results[i] = _answer_cache.get_similar(vector)
+        if results[i] is None:
+            misses.append((i, question, vector))
+    
+    if not misses:
+        return []
+    
+    # Retrieve documents for the remaining questions
+    hits_per_question = search_by_vectors(
+        vector_store,
+        [vector for _, _, vector in misses],
+        TOP_K_RESULTS
+    )
+    return [
+        (i, question, vector, hits)
+        for (i, question, vector), hits in zip(misses, hits_per_question)
+    ]
+
+
+def _llm_inputs(work: List[PendingQuestion]) -> List[Dict[str, str]]:
+    """Build the prompt variables for each pending question"""
+    return [
+        {"context": format_docs([doc for doc, _ in hits]), "question": question}
+        for _, question, _, hits in work
+    ]
+
+
+def _finish_batch(
+    results: List[Optional[Dict[str, Any]]],
+    work: List[PendingQuestion],
+    answers: List
+) -> None:
+    """Fill in the LLM answers and cache the ones backed by sources"""
+    vector_store = get_qa_chain()["vector_store"]
+    for (i, question, vector, hits), answer in zip(work, answers):
+        if isinstance(answer, Exception):
+            logger.error("Error generating answer: %s", answer)
+            results[i] = _empty_result(
+                f"I encountered an error while processing your question: {str(answer)}. Please try again."
+            )
+            continue
+        
+        source_documents = [doc for doc, _ in hits]
+        
+        results[i] = {
+            "answer": answer,
+            "sources": format_sources(source_documents),
+            "confidence": confidence_from_hits(vector_store, hits)
+        }
+        if source_documents:
+            _answer_cache.put(question, vector, dict(results[i]))
+    
+    logger.info("Batch of %d answers generated", len(work))
+
+
+def _fail_batch(results: List[Optional[Dict[str, Any]]], e: Exception) -> List[Dict[str, Any]]:
+    """Fill every unanswered slot with an error answer"""
+    if isinstance(e, FileNotFoundError):
+        logger.error("Index not found: %s", e)
+        error_result = _empty_result("Knowledge base not initialized. Please run the ingestion process first.")
+    else:
+        logger.error("Error generating answers: %s", e)
+        error_result = _empty_result(
+            f"I encountered an error while processing your question: {str(e)}. Please try again."
+        )
+    
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = dict(error_result)
+    return results
+
+
+def get_answers_batch(questions: List[str]) -> List[Dict[str, Any]]:
+    """
+    Answer several questions at once
+    
+    Query embedding and vector search run as a single batch; the LLM calls
+    for the batch are issued concurrently.
+    
+    Args:
+        questions: User questions
+        
+    Returns:
+        One dictionary with 'answer', 'sources', and 'confidence' fields
+        per question, in the same order
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+    try:
+        work = _prepare_batch(questions, results)
+        if work:
+            answers = get_qa_chain()["generate"].batch(
+                _llm_inputs(work),
+                config={"max_concurrency": len(work)},
+                return_exceptions=True
+            )
+            _finish_batch(results, work, answers)
+        return results
+    except Exception as e:
+        return _fail_batch(results, e)
+
+
+async def _generate_limited(generate_chain, inputs: Dict[str, str], llm_limit: Optional[asyncio.Semaphore]) -> str:
+    """Run one LLM call, waiting for a free slot when a limit is given"""
+    if llm_limit is None:
+        return await generate_chain.ainvoke(inputs)
+    async with llm_limit:
+        return await generate_chain.ainvoke(inputs)
+
+
+async def get_answers_batch_async(
+    questions: List[str],
+    executor: Optional[Executor] = None,
+    llm_limit: Optional[asyncio.Semaphore] = None
+) -> List[Dict[str, Any]]:
+    """
+    Answer several questions at once without blocking the event loop
+    
+    Embedding and vector search run on the executor; the LLM calls are
+    awaited on the event loop, so no thread is held while waiting for
+    the provider.
+    
+    Args:
+        questions: User questions
+        executor: Executor for the CPU-bound retrieval step (default
+            executor when None)
+        llm_limit: Semaphore bounding concurrent LLM calls across all
+            batches (unbounded when None)
+        
+    Returns:
+        One dictionary with 'answer', 'sources', and 'confidence' fields
+        per question, in the same order
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(questions)
+    try:
+        work = await asyncio.get_running_loop().run_in_executor(
+            executor,
+            _prepare_batch,
+            questions,
+            results
+        )
+        if work:
+            generate_chain = get_qa_chain()["generate"]
+            answers = await asyncio.gather(
+                *(_generate_limited(generate_chain, inputs, llm_limit) for inputs in _llm_inputs(work)),
+                return_exceptions=True
+            )
+            _finish_batch(results, work, answers)
+        return results
+    except Exception as e:
+        return _fail_batch(results, e)
+
+
+def get_answer(question: str, user_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Get answer to a question using RAG pipeline
     
@@ -181,69 +559,79 @@ def get_answer(question: str, user_id: Optional[str] = None) -> Dict[str, any]:
         
     Returns:
         Dictionary with 'answer', 'sources', and 'confidence' fields
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Processing question from user %s: %s...", user_id, question[:100])
+    
+    result = get_answers_batch([question])[0]
+    logger.info("Answer generated (confidence: %.2f)", result["confidence"])
+    return result
+
+
+def get_answer_stream(question: str, user_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream an answer to a question using RAG pipeline
+    
+    Args:
+        question: User's question
+        user_id: Optional user ID for logging/tracking
         
-    Raises:
-        Exception: If retrieval or generation fails
+    Yields:
+        {'token': str} for each generated chunk of the answer, followed by
+        a final {'done': True, 'sources': [...], 'confidence': float}
     """
     if not question or not question.strip():
-        return {
-            "answer": "Please provide a valid question.",
-            "sources": [],
-            "confidence": 0.0
-        }
+        yield {"token": "Please provide a valid question."}
+        yield {"done": True, "sources": [], "confidence": 0.0}
+        return
     
     try:
-        logger.info(f"Processing question from user {user_id}: {question[:100]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Streaming answer for user %s: %s...", user_id, question[:100])
         
         qa_chain_dict = get_qa_chain()
-        rag_chain = qa_chain_dict["chain"]
-        retriever = qa_chain_dict["retriever"]
+        generate_chain = qa_chain_dict["generate"]
+        vector_store = qa_chain_dict["vector_store"]
         
-        # Retrieve documents
-        source_documents = retriever.invoke(question)
+        # Embed the question once and reuse the vector for cache and search
+        query_vector = vector_store.embeddings.embed_query(question)
+        cached = _answer_cache.get(question) or _answer_cache.get_similar(query_vector)
+        if cached is not None:
+            yield {"token": cached["answer"]}
+            yield {"done": True, "sources": cached["sources"], "confidence": cached["confidence"]}
+            return
         
-        # Run the QA chain
-        answer = rag_chain.invoke(question)
+        hits = search_by_vectors(vector_store, [query_vector], TOP_K_RESULTS)[0]
+        source_documents = [doc for doc, _ in hits]
         
-        # Extract source information
-        sources = []
-        for doc in source_documents[:3]:  # Limit to top 3 sources
-            sources.append({
-                "content_preview": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                "metadata": doc.metadata if hasattr(doc, 'metadata') else {}
-            })
+        # Stream the LLM output
+        answer_parts = []
+        for token in generate_chain.stream(
+            {"context": format_docs(source_documents), "question": question}
+        ):
+            if token:
+                answer_parts.append(token)
+                yield {"token": token}
         
-        # Simple confidence metric based on number of sources
-        confidence = min(1.0, len(source_documents) / settings.top_k_results)
-        
-        logger.info(f"Answer generated successfully (confidence: {confidence:.2f})")
-        
-        return {
-            "answer": answer,
-            "sources": sources,
-            "confidence": confidence
+        result = {
+            "answer": "".join(answer_parts),
+            "sources": format_sources(source_documents),
+            "confidence": confidence_from_hits(vector_store, hits)
+        }
+        if source_documents:
+            _answer_cache.put(question, query_vector, dict(result))
+        yield {
+            "done": True,
+            "sources": result["sources"],
+            "confidence": result["confidence"]
         }
         
     except FileNotFoundError as e:
-        logger.error(f"Index not found: {str(e)}")
-        return {
-            "answer": "Knowledge base not initialized. Please run the ingestion process first.",
-            "sources": [],
-            "confidence": 0.0
-        }
+        logger.error("Index not found: %s", e)
+        yield {"token": "Knowledge base not initialized. Please run the ingestion process first."}
+        yield {"done": True, "sources": [], "confidence": 0.0}
     except Exception as e:
-        logger.error(f"Error generating answer: {str(e)}")
-        return {
-            "answer": f"I encountered an error while processing your question: {str(e)}. Please try again.",
-            "sources": [],
-            "confidence": 0.0
-        }
+        logger.error("Error streaming answer: %s", e)
+        yield {"token": f"I encountered an error while processing your question: {str(e)}. Please try again."}
+        yield {"done": True, "sources": [], "confidence": 0.0}
 
-
-# Initialize on module import (lazy loading)
-try:
-    load_vector_store()
-except FileNotFoundError:
-    logger.warning("Vector store not found. Run ingest.py to create the index.")
-except Exception as e:
-    logger.error(f"Error during initialization: {str(e)}")
@@ -26,7 +26,7 @@ EMBEDDING_MODEL=text-embedding-3-small
 
 # Data Configuration
 DATA_DIR=knowledge_data
-INDEX_FILE=faiss_index.pkl
+INDEX_DIR=faiss_index
 
 # Logging
 LOG_LEVEL=INFO